@@ -1,81 +1,254 @@
 import argparse
 import json
+import multiprocessing
+import os
 import pathlib
+import socket
+import threading
 import time
 
 import groq
-from langchain_groq import ChatGroq
 import tqdm
 
-from src import prepare_qwen_models
-from src import prepare_groq_model
-from src import create_workflow
-from src import QwenLLM
+from src import prepare_llm
+from src import profiling
+from src import WORKFLOWS
+from src import align_sentences
+from src import chunk_sentence_pair
+from src import schedule
+from src import ThroughputMeter
+from src import WorkQueue
+from src import ShardWriter
+from src import load_records
+from src.scheduler import POLICIES
+from src.prepare_models import BACKENDS
 
-def prepare_sentences(inputs: str):
+def prepare_sentences(inputs: str, max_chars: int | None = None):
     with open(inputs, "r", encoding="utf-8") as f:
         data = json.load(f)
     input_per_sentence = {}
     for title, value in data.items():
         if "tashkeel" in value and "article" in value:
-            if len(value["tashkeel"]) > 0 and len(value["tashkeel"]) == len(value["article"]):
-                for sentence, sentence_tashkeel in zip(value["article"], value["tashkeel"]):
-                    new_val = {
-                        "arabic_sentence": sentence,
-                        "true_tashkeel": sentence_tashkeel,
-                        "title": title,
-                        "link": value["link"],
-                        "lang_break_content": value["lang_break_content"]
-                    }
-                    input_per_sentence[sentence] = new_val
+            if len(value["tashkeel"]) == 0:
+                continue
+            if len(value["tashkeel"]) == len(value["article"]):
+                pairs = list(zip(value["article"], value["tashkeel"]))
+            else:
+                pairs = align_sentences(value["article"], value["tashkeel"])
+            if max_chars is not None:
+                pairs = [
+                    chunk
+                    for sentence, sentence_tashkeel in pairs
+                    for chunk in chunk_sentence_pair(sentence, sentence_tashkeel, max_chars)
+                ]
+            for sentence, sentence_tashkeel in pairs:
+                new_val = {
+                    "arabic_sentence": sentence,
+                    "true_tashkeel": sentence_tashkeel,
+                    "title": title,
+                    "link": value["link"],
+                    "lang_break_content": value["lang_break_content"]
+                }
+                input_per_sentence[sentence] = new_val
     return input_per_sentence
 
 
+def translate_batch(graph, batch: list[str], batch_size: int) -> tuple[list[dict], float]:
+    """LLM outputs of the batch and the seconds spent waiting before retries."""
+    has_error = True
+    waited = 0.0
+    while has_error:
+        try:
+            # Attempt to invoke the LLM
+            if len(batch) == 1:
+                llm_outputs = [graph.invoke({"arabic_sentence": batch[0]})["combined_output"]]
+            else:
+                llm_outputs = [
+                    out["combined_output"]
+                    for out in graph.batch(
+                        [{"arabic_sentence": sentence} for sentence in batch],
+                        config={"max_concurrency": batch_size})
+                ]
+            # If successful, set has_error to False to exit the loop
+            has_error = False
+        except (groq.APIConnectionError, groq.RateLimitError) as e:
+            # Handle the error (e.g., log it, wait before retrying, etc.)
+            has_error = True
+            print(f"An error occurred: {e}. Retrying in 60s...")
+            # Optionally, add a delay before retrying to avoid rapid consecutive attempts
+            time.sleep(60)
+            waited += 60
+    return llm_outputs, waited
+
+
+def renew_leases(
+        queue_path: pathlib.Path,
+        worker: str,
+        sentences: list[str],
+        lease_timeout: float,
+        stop: threading.Event):
+    """Keep the lease of the sentences being translated until `stop` is set, so a slow batch is not taken over."""
+    queue = WorkQueue(queue_path, lease_timeout)
+    while not stop.wait(lease_timeout / 3):
+        queue.renew(worker, sentences)
+    queue.close()
+
+
+def run_worker(
+        queue_path: pathlib.Path,
+        backend: str,
+        batch_size: int,
+        lease_timeout: float,
+        workflow_name: str = "graph",
+        num_threads: int | None = None,
+        profile: pathlib.Path | None = None,
+        poll_interval: float = 10):
+    """Lease sentences from the queue until every sentence is done or failed."""
+    # Spawned workers have their own profiler, their trace is merged by main_queue
+    own_profile = profile is not None and not profiling.PROFILER.enabled
+    if own_profile:
+        profiling.start_profiling(profile)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    queue = WorkQueue(queue_path, lease_timeout)
+    llm = prepare_llm(backend, num_threads, batch_size)
+    graph = WORKFLOWS[workflow_name](llm).compile()
+    meter = ThroughputMeter("queue", getattr(llm, "tokenizer", None))
+    while True:
+        leased = queue.lease(worker, batch_size)
+        if len(leased) == 0:
+            if queue.remaining() == 0:
+                break
+            # Other workers hold the last leases: wait for them to finish or to expire
+            time.sleep(poll_interval)
+            continue
+        batch = list(leased)
+        start = time.time()
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=renew_leases, args=(queue_path, worker, batch, lease_timeout, stop), daemon=True)
+        heartbeat.start()
+        try:
+            llm_outputs, waited = translate_batch(graph, batch, batch_size)
+        except Exception as e:
+            print(f"[{worker}] Cannot process {len(batch)} sentences: {e}")
+            queue.release(batch, repr(e))
+            continue
+        finally:
+            stop.set()
+            heartbeat.join()
+        # Rate limit waits are not part of the throughput
+        meter.update(batch, time.time() - start - waited)
+        queue.complete(worker, dict(zip(batch, llm_outputs)))
+        print(f"[{worker}] {queue.counts()}")
+    print(f"[{worker}] {meter.report()}")
+    queue.close()
+    if own_profile:
+        profiling.write_worker_trace(profile)
+
+
+def main_queue(
+        sentences: dict[str, dict],
+        output: pathlib.Path,
+        queue_path: pathlib.Path,
+        backend: str,
+        batch_size: int,
+        lease_timeout: float,
+        num_workers: int,
+        workflow_name: str = "graph",
+        output_format: str = "json",
+        num_threads: int | None = None,
+        profile: pathlib.Path | None = None):
+    queue = WorkQueue(queue_path, lease_timeout)
+    print(f"Added {queue.enqueue(sentences)} sentences to {queue_path}: {queue.counts()}")
+    if num_workers == 1:
+        run_worker(queue_path, backend, batch_size, lease_timeout, workflow_name, num_threads, profile)
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        workers = [
+            ctx.Process(
+                target=run_worker,
+                args=(queue_path, backend, batch_size, lease_timeout, workflow_name, num_threads, profile))
+            for _ in range(num_workers)
+        ]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        profiling.merge_worker_traces(profile)
+    print(f"Merged {queue.merge_into(output, output_format)} sentences into {output}: {queue.counts()}")
+    queue.close()
+
+
 def main(
         inputs: str,
         output: pathlib.Path,
-        use_groq: bool):
+        backend: str = "qwen",
+        max_sentence_chars: int | None = None,
+        policy: str = "insertion",
+        batch_size: int = 1,
+        num_buckets: int = 8,
+        queue: pathlib.Path | None = None,
+        lease_timeout: float = 600,
+        num_workers: int = 1,
+        workflow_name: str = "graph",
+        output_format: str = "json",
+        num_threads: int | None = None,
+        profile: pathlib.Path | None = None):
+    profiling.start_profiling(profile)
     res = {}
     if output.exists():
-        with open(output, "r", encoding="utf-8") as f:
-            res = json.load(f)
+        res = load_records(output)
     else:
         output.parent.mkdir(exist_ok=True, parents=True)
 
-    llm: QwenLLM | ChatGroq
-    if use_groq:
-        llm = prepare_groq_model()
-    else:
-        llm = prepare_qwen_models()
+    with profiling.span("segmentation"):
+        sentences = prepare_sentences(inputs=inputs, max_chars=max_sentence_chars)
+    print(f"There are {len(sentences)} sentences:")
+    pending = {sentence: val for sentence, val in sentences.items() if sentence not in res}
+
+    if queue is not None:
+        # Enqueue in scheduling order, workers lease in insertion order
+        ordered = {
+            sentence: pending[sentence]
+            for batch, _ in schedule(pending, policy, batch_size, num_buckets)
+            for sentence in batch
+        }
+        main_queue(
+            ordered, output, queue, backend, batch_size, lease_timeout, num_workers, workflow_name, output_format,
+            num_threads, profile)
+        profiling.finish_profiling(profile)
+        return
 
-    workflow = create_workflow(llm)
+    llm = prepare_llm(backend, num_threads, batch_size)
+    workflow = WORKFLOWS[workflow_name](llm)
     graph = workflow.compile()
-    sentences = prepare_sentences(inputs=inputs)
-    print(f"There are {len(sentences)} sentences:")
-    pbar = tqdm.tqdm(sentences.items())
-    for sentence, val in pbar:
-        if sentence not in res:
+    tokenizer = getattr(llm, "tokenizer", None)
+    meter = ThroughputMeter(policy, tokenizer)
+    pbar = tqdm.tqdm(total=len(pending))
+    with ShardWriter(output) as shard_writer:
+        for batch, num_tokens in schedule(pending, policy, batch_size, num_buckets, tokenizer):
             start = time.time()
-            has_error = True
-            while has_error:
-                try:
-                    # Attempt to invoke the LLM
-                    llm_output = graph.invoke({"arabic_sentence": sentence})["combined_output"]
-                    # If successful, set has_error to False to exit the loop
-                    has_error = False
-                except (groq.APIConnectionError, groq.RateLimitError) as e:
-                    # Handle the error (e.g., log it, wait before retrying, etc.)
-                    has_error = True
-                    print(f"An error occurred: {e}. Retrying in 60s...")
-                    # Optionally, add a delay before retrying to avoid rapid consecutive attempts
-                    time.sleep(60)
-            
+            llm_outputs, waited = translate_batch(graph, batch, batch_size)
             end = time.time()
+            # Rate limit waits are not part of the throughput of the schedule
+            meter.update(batch, end - start - waited, num_tokens)
+            pbar.update(len(batch))
             pbar.set_description_str(f"time={end-start:2.1f}")
-            val["llm_output"] = llm_output
-            res[sentence] = val
-            with open(output, "w", encoding="utf-8") as f:
-                json.dump(res, f, ensure_ascii=False, indent=4)
+            for sentence, llm_output in zip(batch, llm_outputs):
+                val = pending[sentence]
+                val["llm_output"] = llm_output
+                res[sentence] = val
+                if output_format == "shards":
+                    shard_writer.add(sentence, val)
+            if output_format == "shards":
+                # One shard per batch so a crash only loses the batch being translated
+                with profiling.span("output_write"):
+                    shard_writer.flush()
+            if output_format == "json":
+                with profiling.span("output_write"), open(output, "w", encoding="utf-8") as f:
+                    json.dump(res, f, ensure_ascii=False, indent=4)
+    print(meter.report())
+    profiling.finish_profiling(profile)
 
     
     
@@ -84,7 +257,47 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser("Automatic translation of one sentence and output")
     parser.add_argument("--inputs", "--input", "-i", type=str, help="Sentence in Arabic")
     parser.add_argument("--output", "-o", type=pathlib.Path, help="output")
-    parser.add_argument("--use-groq", action="store_true", help="Use Groq")
+    parser.add_argument(
+        "--backend", type=str, default="qwen", choices=BACKENDS,
+        help="qwen: Qwen2.5 72B on GPU. groq: Groq API. cpu: small int8 model on CPU")
+    parser.add_argument("--use-groq", action="store_const", const="groq", dest="backend", help="Use Groq")
+    parser.add_argument("--num-threads", type=int, default=None, help="Number of torch threads with --backend cpu")
+    parser.add_argument(
+        "--max-sentence-chars", type=int, default=None,
+        help="Split sentences longer than this number of characters (at commas first, then at words)")
+    parser.add_argument(
+        "--policy", type=str, default="insertion", choices=POLICIES,
+        help="Order in which sentences are sent to the LLM")
+    parser.add_argument("--batch-size", type=int, default=1, help="Number of sentences processed concurrently")
+    parser.add_argument("--num-buckets", type=int, default=8, help="Number of length buckets for --policy bucketed")
+    parser.add_argument(
+        "--queue", type=pathlib.Path, default=None,
+        help="SQLite work queue shared by several processes. Results are merged into --output at the end")
+    parser.add_argument(
+        "--lease-timeout", type=float, default=600,
+        help="Seconds before sentences leased by a crashed worker are given to another one")
+    parser.add_argument("--num-workers", type=int, default=1, help="Number of worker processes with --queue")
+    parser.add_argument(
+        "--workflow", type=str, default="graph", choices=list(WORKFLOWS),
+        help="graph: one LLM call per field. fused: one call for every field, per-field calls only for invalid fields")
+    parser.add_argument(
+        "--output-format", type=str, default="json", choices=["json", "shards"],
+        help="json: one indented file. shards: --output is a directory of compact columnar shards")
+    profiling.add_profile_argument(parser)
     args = parser.parse_args()
 
-    main(args.inputs, args.output, args.use_groq)
\ No newline at end of file
+    main(
+        args.inputs,
+        args.output,
+        args.backend,
+        args.max_sentence_chars,
+        args.policy,
+        args.batch_size,
+        args.num_buckets,
+        args.queue,
+        args.lease_timeout,
+        args.num_workers,
+        args.workflow,
+        args.output_format,
+        args.num_threads,
+        args.profile)
\ No newline at end of file
@@ -4,19 +4,56 @@ import json
 import pathlib
 import time
 
-from src import prepare_qwen_models
-from src import create_workflow
+from src import prepare_llm
+from src import WORKFLOWS
+from src.prepare_models import BACKENDS
+from src.template_translation_arabic import STREAM_TRANSLATION_KEY
 
 
-def main(sentence: str, output: pathlib.Path):
+def stream_graph(graph, sentence: str) -> dict:
+    """Print each node result as soon as it is done, and the translation token by token."""
+    start = time.time()
+    res = {}
+    config = {"configurable": {STREAM_TRANSLATION_KEY: True}}
+    for mode, chunk in graph.stream({"arabic_sentence": sentence}, config=config, stream_mode=["updates", "custom"]):
+        if mode == "custom":
+            print(chunk["translated_sentence"], end="", flush=True)
+            continue
+        for node, update in chunk.items():
+            if update is None:
+                # Node without any valid field (invalid fused answer), the fallback nodes follow
+                continue
+            if node == "aggregate":
+                res = update["combined_output"]
+            elif node == "get_translation":
+                print(f"\n[{node} {time.time() - start: 2.2f}s]")
+            else:
+                for key, value in update.items():
+                    print(f"[{node} {time.time() - start: 2.2f}s] {key}:\n{value}")
+                if node == "get_tashkeel":
+                    print("[get_translation] translated_sentence:")
+    return res
+
+
+def main(
+        sentence: str,
+        output: pathlib.Path,
+        stream: bool = False,
+        workflow_name: str = "graph",
+        backend: str = "qwen",
+        num_threads: int | None = None):
     
-    llm = prepare_qwen_models()
-    workflow = create_workflow(llm)
+    llm = prepare_llm(backend, num_threads)
+    workflow = WORKFLOWS[workflow_name](llm)
     graph = workflow.compile()
     start = time.time()
-    res = graph.invoke({"arabic_sentence": sentence})["combined_output"]
+    if stream:
+        res = stream_graph(graph, sentence)
+    else:
+        res = graph.invoke({"arabic_sentence": sentence})["combined_output"]
     end = time.time()
-    print(res)
+    if not stream:
+        print(res)
     print(f"It took: {end - start: 2.2f}s")
     output.parent.mkdir(exist_ok=True, parents=True)
     with open(output, "w", encoding="utf-8") as f:
@@ -28,9 +65,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser("Automatic translation of one sentence and output")
     parser.add_argument("--sentence", type=str, help="Sentence in Arabic")
     parser.add_argument("--output", "-o", type=pathlib.Path, help="output")
+    parser.add_argument("--stream", action="store_true", help="Print each result as soon as it is ready")
+    parser.add_argument(
+        "--workflow", type=str, default="graph", choices=list(WORKFLOWS),
+        help="graph: one LLM call per field. fused: one call for every field")
+    parser.add_argument("--backend", type=str, default="qwen", choices=BACKENDS)
+    parser.add_argument("--num-threads", type=int, default=None, help="Number of torch threads with --backend cpu")
     args = parser.parse_args()
 
-    main(args.sentence, args.output)
+    main(args.sentence, args.output, args.stream, args.workflow, args.backend, args.num_threads)
 
 
     
\ No newline at end of file
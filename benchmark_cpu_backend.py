@@ -0,0 +1,76 @@
+"""Tokens/s and per-sentence latency of each node of the workflow with the CPU backend."""
+import argparse
+import json
+import pathlib
+import time
+
+import tqdm
+
+from automatic_translation_all import prepare_sentences
+from src import LLMCallCounter
+from src import WORKFLOWS
+from src import prepare_cpu_model
+
+
+def main(
+        inputs: str,
+        num_sentences: int,
+        model_name: str,
+        num_threads: int | None,
+        quantize: bool,
+        workflow_name: str,
+        output: pathlib.Path | None = None):
+    sentences = list(prepare_sentences(inputs))[:num_sentences]
+    start = time.time()
+    llm = prepare_cpu_model(model_name, num_threads, quantize)
+    print(f"Model loaded in {time.time() - start:.1f}s")
+    graph = WORKFLOWS[workflow_name](llm).compile()
+    counter = LLMCallCounter(llm.tokenizer)
+
+    elapsed = 0.0
+    for sentence in tqdm.tqdm(sentences):
+        start = time.time()
+        # One node at a time so the latency of each node is not shared with the others
+        graph.invoke({"arabic_sentence": sentence}, config={"callbacks": [counter], "max_concurrency": 1})
+        elapsed += time.time() - start
+
+    n = max(len(sentences), 1)
+    res = {
+        "seconds_per_sentence": elapsed / n,
+        "tokens_per_second": counter.completion_tokens / max(elapsed, 1e-9),
+        "nodes": {
+            node: {
+                "seconds_per_sentence": stats["seconds"] / n,
+                "tokens_per_second": stats["completion_tokens"] / max(stats["seconds"], 1e-9),
+            }
+            for node, stats in counter.per_node.items()
+        },
+    }
+    print(f"{'node':<28}{'s/sentence':>12}{'tokens/s':>10}")
+    for node, stats in res["nodes"].items():
+        print(f"{node:<28}{stats['seconds_per_sentence']:>12.2f}{stats['tokens_per_second']:>10.1f}")
+    print(f"{'total':<28}{res['seconds_per_sentence']:>12.2f}{res['tokens_per_second']:>10.1f}")
+    if output is not None:
+        output.parent.mkdir(exist_ok=True, parents=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Benchmark the CPU backend")
+    parser.add_argument("--inputs", "--input", "-i", type=str, help="Scraped articles")
+    parser.add_argument("--num-sentences", "-n", type=int, default=5)
+    parser.add_argument("--model-name", type=str, default="Qwen/Qwen2.5-1.5B-Instruct")
+    parser.add_argument("--num-threads", type=int, default=None)
+    parser.add_argument("--no-quantize", action="store_true", help="Keep float32 weights")
+    parser.add_argument("--workflow", type=str, default="graph", choices=list(WORKFLOWS))
+    parser.add_argument("--output", "-o", type=pathlib.Path, default=None, help="Save the results as json")
+    args = parser.parse_args()
+    main(
+        args.inputs,
+        args.num_sentences,
+        args.model_name,
+        args.num_threads,
+        not args.no_quantize,
+        args.workflow,
+        args.output)
@@ -0,0 +1,83 @@
+"""Compare pages/s of the http and Playwright article fetchers on a local fixture server."""
+import argparse
+import http.server
+import threading
+import time
+
+from scrape_arabic_text import extract_article_content
+from scrape_arabic_text import fetch_articles
+from scrape_arabic_text import parse_article_content
+
+FIXTURE_SENTENCE = "بالنسبة إلى العديد من القرويين هنا يبدأ اليوم مع شروق الشمس."
+FIXTURE_SENTENCE_TASHKEEL = "بِالنِّسْبَةِ إِلَى الْعَدِيدِ مِنَ الْقَرَوِيِّينَ هُنَا يَبْدَأُ الْيَوْمُ مَعَ شُرُوقِ الشَّمْسِ."
+
+
+def fixture_page(num_paragraphs: int, tashkeel_button: bool = True, tashkeel_div: bool = True) -> bytes:
+    paragraphs = "".join(f"<p>{FIXTURE_SENTENCE}</p>" for _ in range(num_paragraphs))
+    paragraphs_tashkeel = "".join(f"<p>{FIXTURE_SENTENCE_TASHKEEL}</p>" for _ in range(num_paragraphs))
+    button = '<ul><li class="pull-right btn tashkeel">Tashkeel</li></ul>' if tashkeel_button else ""
+    hidden = f'<div class="body-text hidden field">{paragraphs_tashkeel}</div>' if tashkeel_div else ""
+    html = f"""<!DOCTYPE html>
+    <html><head><meta charset="utf-8"></head><body>
+    <div class="pull-left">Article</div>
+    {button}
+    <div class="body-text field">{paragraphs}</div>
+    {hidden}
+    </body></html>"""
+    return html.encode("utf-8")
+
+
+def check_tashkeel_detection():
+    """The hidden div alone gives the tashkeel, the button without the div goes to the Playwright fallback."""
+    content = parse_article_content(fixture_page(1, tashkeel_button=False).decode("utf-8"))
+    assert content is not None and content[1] is not None
+    assert parse_article_content(fixture_page(1, tashkeel_div=False).decode("utf-8")) is None
+
+
+def start_fixture_server(page: bytes) -> http.server.ThreadingHTTPServer:
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(num_pages: int, num_playwright_pages: int, num_workers: int, num_paragraphs: int):
+    check_tashkeel_detection()
+    server = start_fixture_server(fixture_page(num_paragraphs))
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    links = [f"{base}/article/{i}" for i in range(num_pages)]
+
+    start = time.time()
+    res = fetch_articles(links, num_workers, use_http=True)
+    elapsed = time.time() - start
+    assert all(not isinstance(content, Exception) and content[1] is not None for content in res.values())
+    print(f"http: {num_pages} pages in {elapsed:.2f}s, {num_pages / elapsed:.1f} pages/s")
+
+    start = time.time()
+    for link in links[:num_playwright_pages]:
+        extract_article_content(link)
+    elapsed = time.time() - start
+    print(f"playwright: {num_playwright_pages} pages in {elapsed:.2f}s, {num_playwright_pages / elapsed:.1f} pages/s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Benchmark article fetching")
+    parser.add_argument("--num-pages", type=int, default=500)
+    parser.add_argument("--num-playwright-pages", type=int, default=10)
+    parser.add_argument("--num-workers", type=int, default=8)
+    parser.add_argument("--num-paragraphs", type=int, default=30)
+    args = parser.parse_args()
+    main(args.num_pages, args.num_playwright_pages, args.num_workers, args.num_paragraphs)
@@ -0,0 +1,70 @@
+"""Compare LLM calls, tokens and wall time per sentence of the available workflows."""
+import argparse
+import json
+import pathlib
+import time
+
+import tqdm
+
+from automatic_translation_all import prepare_sentences
+from src import LLMCallCounter
+from src import prepare_llm
+from src import WORKFLOWS
+from src.prepare_models import BACKENDS
+
+
+def benchmark_workflow(graph, sentences: list[str], counter: LLMCallCounter) -> dict[str, float]:
+    calls, prompt_tokens, completion_tokens, elapsed = 0, 0, 0, 0.0
+    for sentence in tqdm.tqdm(sentences):
+        counter.reset()
+        start = time.time()
+        graph.invoke({"arabic_sentence": sentence}, config={"callbacks": [counter]})
+        elapsed += time.time() - start
+        calls += counter.calls
+        prompt_tokens += counter.prompt_tokens
+        completion_tokens += counter.completion_tokens
+    n = max(len(sentences), 1)
+    return {
+        "calls_per_sentence": calls / n,
+        "prompt_tokens_per_sentence": prompt_tokens / n,
+        "completion_tokens_per_sentence": completion_tokens / n,
+        "seconds_per_sentence": elapsed / n,
+    }
+
+
+def main(
+        inputs: str,
+        num_sentences: int,
+        backend: str,
+        workflows: list[str],
+        output: pathlib.Path | None = None):
+    sentences = list(prepare_sentences(inputs))[:num_sentences]
+    llm = prepare_llm(backend)
+    counter = LLMCallCounter(getattr(llm, "tokenizer", None))
+    res = {}
+    for name in workflows:
+        print(f"Workflow {name} on {len(sentences)} sentences")
+        graph = WORKFLOWS[name](llm).compile()
+        res[name] = benchmark_workflow(graph, sentences, counter)
+
+    print(f"{'workflow':<10}{'calls':>8}{'prompt tok':>12}{'compl. tok':>12}{'s/sentence':>12}")
+    for name, stats in res.items():
+        print(
+            f"{name:<10}{stats['calls_per_sentence']:>8.2f}{stats['prompt_tokens_per_sentence']:>12.0f}"
+            f"{stats['completion_tokens_per_sentence']:>12.0f}{stats['seconds_per_sentence']:>12.2f}")
+    if output is not None:
+        output.parent.mkdir(exist_ok=True, parents=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Benchmark the translation workflows")
+    parser.add_argument("--inputs", "--input", "-i", type=str, help="Scraped articles")
+    parser.add_argument("--num-sentences", "-n", type=int, default=10)
+    parser.add_argument("--backend", type=str, default="qwen", choices=BACKENDS)
+    parser.add_argument("--use-groq", action="store_const", const="groq", dest="backend", help="Use Groq")
+    parser.add_argument("--workflows", type=str, nargs="+", default=list(WORKFLOWS), choices=list(WORKFLOWS))
+    parser.add_argument("--output", "-o", type=pathlib.Path, default=None, help="Save the results as json")
+    args = parser.parse_args()
+    main(args.inputs, args.num_sentences, args.backend, args.workflows, args.output)
@@ -0,0 +1,41 @@
+"""Convert a legacy JSON output of automatic_translation_all.py to compact columnar shards."""
+import argparse
+import json
+import pathlib
+
+from src import ShardWriter
+from src import load_records
+
+
+def convert_record(record: dict) -> dict:
+    """Decode the legacy vocabulary string without validating it, every word rendered before is kept."""
+    llm_output = record.get("llm_output", {})
+    vocabulary = llm_output.get("vocabulary")
+    if isinstance(vocabulary, str):
+        try:
+            vocabulary = json.loads(vocabulary)
+        except json.JSONDecodeError:
+            # Keep the raw LLM answer, it will be skipped by the deck builder as before
+            vocabulary = None
+        if isinstance(vocabulary, dict):
+            llm_output["vocabulary"] = vocabulary
+    return record
+
+
+def main(input_json: pathlib.Path, out_dir: pathlib.Path, shard_size: int):
+    data = load_records(input_json)
+    with ShardWriter(out_dir, shard_size) as writer:
+        for sentence, record in data.items():
+            writer.add(sentence, convert_record(record))
+    size_in = input_json.stat().st_size
+    size_out = sum(path.stat().st_size for path in out_dir.iterdir())
+    print(f"{len(data)} sentences: {size_in / 1e6:.2f}MB -> {size_out / 1e6:.2f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Convert legacy JSON flashcard data to shards")
+    parser.add_argument("--input-json", "-i", type=pathlib.Path)
+    parser.add_argument("--out", "-o", type=pathlib.Path)
+    parser.add_argument("--shard-size", type=int, default=1024)
+    args = parser.parse_args()
+    main(args.input_json, args.out, args.shard_size)
@@ -7,10 +7,16 @@ from typing import Optional, Sequence
 import genanki
 import tqdm
 
+from src import load_records
+from src import profiling
 
-def json_to_html(json_str: str) -> str | None:
+
+def json_to_html(vocabulary: str | dict | None) -> str | None:
     try:
-        data = json.loads(json_str)
+        # Legacy outputs store the vocabulary as a JSON string
+        data = json.loads(vocabulary) if isinstance(vocabulary, str) else vocabulary
+        if data is None:
+            return None
         html = ""
         for word, details in data.items():
             html += f"<h2>{word}</h2>"
@@ -19,7 +25,7 @@ def json_to_html(json_str: str) -> str | None:
             if 'meanings' in details:
                 html += "<p><strong>Meanings:</strong> " + ", ".join(details['meanings']) + "</p>"
             
-            if 'root' in details:
+            if isinstance(details.get('root'), dict):
                 root = details['root']
                 html += f"<p><strong>Root Word:</strong> {root.get('root_word', 'N/A')}</p>"
                 html += f"<p><strong>Root Meaning:</strong> {root.get('root_meaning', 'N/A')}</p>"
@@ -47,6 +53,7 @@ def get_parser():
     parser.add_argument("--title", type=str)
     parser.add_argument("--out", "-o", type=pathlib.Path)
     parser.add_argument("--labels", type=str, nargs="+", default=None)
+    profiling.add_profile_argument(parser)
     return parser
 
 class FlashCard:
@@ -60,7 +67,8 @@ class FlashCard:
             info: dict[str, str | dict],
             labels: Optional[Sequence[str]]=None) -> genanki.Deck:
         llm_output = info["llm_output"]
-        vocab = json_to_html(llm_output["vocabulary"])
+        with profiling.span("html_render"):
+            vocab = json_to_html(llm_output["vocabulary"])
         if vocab is not None:
             note = genanki.Note(
                 model=self.model,
@@ -175,18 +183,21 @@ def init_flashcard_reverse(title: str) -> FlashCard:
         title)
     return FlashCard(model, deck)
 
-def main(input_json: pathlib.Path, title: str, out: pathlib.Path):
+def main(input_json: pathlib.Path, title: str, out: pathlib.Path, profile: pathlib.Path | None = None):
+    profiling.start_profiling(profile)
     flashcard = init_flashcard_reverse(title)
-    with open(input_json, "r", encoding='utf-8') as f:
-        data: dict = json.load(f)
+    with profiling.span("json_parse"):
+        data = load_records(input_json)
     for info in tqdm.tqdm(data.values()):
         flashcard.add_reversible_flashcard(info)
-    genanki.Package(flashcard.deck).write_to_file(out)
+    with profiling.span("apkg_write"):
+        genanki.Package(flashcard.deck).write_to_file(out)
+    profiling.finish_profiling(profile)
 
 
 if __name__ == "__main__":
     args = get_parser().parse_args()
-    main(args.input_json, args.title, args.out)
+    main(args.input_json, args.title, args.out, args.profile)
 
     
     
\ No newline at end of file
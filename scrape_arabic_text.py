@@ -1,4 +1,6 @@
 import argparse
+import concurrent.futures
+import functools
 import json
 import pathlib
 import re
@@ -6,9 +8,18 @@ import time
 
 import bs4
 from bs4 import BeautifulSoup
+import httpx
 from playwright.sync_api import Browser, sync_playwright
 
+from src import profiling
+from src import segmentation
+from src import align_sentences
+from src import split_sentences
+from src import PageCache
+from src.page_cache import read_page
+
 WEBSITE = "https://learning.aljazeera.net/en"
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"}
 
 def extract_cards(content: str):
     soup = BeautifulSoup(content, "html.parser")
@@ -27,34 +38,126 @@ def extract_text(div):
     return texts
     
 
-def extract_article_content(website: str):
+def parse_article_content(content: str) -> tuple[str, str | None] | None:
+    """Article text and tashkeel text from the server rendered HTML, None if the article div is missing."""
+    soup = BeautifulSoup(content, 'html.parser')
+    divs = soup.find_all('div', class_=re.compile('.*body-text field.*'))
+    if len(divs) == 0:
+        return None
+    rtl = extract_text(divs[0])
+    text = " ".join(rtl)
+    tashkeel = None
+
+    # Detect Tashkeel button
+    filtered_buttons = []
+    for li in soup.find_all('li'):
+        class_name = " ".join(li.get('class', []))
+        if class_name and 'pull-right' in class_name and 'btn' in class_name and 'tashkeel' in class_name:
+            filtered_buttons.append(li)
+    tashkeel_button = None if len(filtered_buttons) == 0 else filtered_buttons[0]
+
+    # Extract tashkeel text from the hidden div, it is server rendered even when the button is not
+    divs = soup.find_all('div', class_=re.compile('.*body-text hidden field.*'))
+    if len(divs) > 0:
+        rtl_tashkeel = extract_text(divs[0])
+        tashkeel = " ".join(rtl_tashkeel)
+    elif tashkeel_button:
+        # The page has tashkeel but the div is not in this HTML: let the caller render it with Playwright
+        return None
+
+    return text, tashkeel
+
+
+def extract_article_content(website: str, cache: PageCache | None = None):
     with sync_playwright() as pw:
         chrome = pw.chromium.launch()
         page = chrome.new_page()
-        page.goto(website)
-        page.wait_for_selector(".pull-left")
-        soup = BeautifulSoup(page.content(), 'html.parser')
-        div = list(soup.find_all('div', class_=re.compile('.*body-text field.*')))[0]
-        rtl = extract_text(div)
-        text = " ".join(rtl)
-        tashkeel = None
-
-        # Detect Tashkeel button
-        all_li_elements = page.query_selector_all('li')
-        filtered_buttons = []
-        for li in all_li_elements:
-            class_name = li.get_attribute('class')
-            if class_name and 'pull-right' in class_name and 'btn' in class_name and 'tashkeel' in class_name:
-                filtered_buttons.append(li)
-        tashkeel_button = None if len(filtered_buttons) == 0 else filtered_buttons[0]
-        
-        # Extract tashkeel text
-        if tashkeel_button:    
-            div = list(soup.find_all('div', class_=re.compile('.*body-text hidden field.*')))[0]
-            rtl_tashkeel = extract_text(div)
-            tashkeel = " ".join(rtl_tashkeel)
-            
-        return text, tashkeel
+        with profiling.span("page_fetch"):
+            page.goto(website)
+            page.wait_for_selector(".pull-left")
+            content = page.content()
+        if cache is not None:
+            cache.put(website, content)
+        with profiling.span("html_parse"):
+            res = parse_article_content(content)
+        if res is None:
+            raise ValueError(f"No article found in {website}")
+        return res
+
+
+def extract_article_content_http(
+        client: httpx.Client,
+        website: str,
+        cache: PageCache | None = None) -> tuple[str, str | None] | None:
+    """Article text and tashkeel text, None if the page cannot be fetched or parsed so Playwright is used instead."""
+    headers = {} if cache is None else cache.conditional_headers(website)
+    try:
+        with profiling.span("page_fetch"):
+            response = client.get(website, headers=headers)
+        if response.status_code == 304 and cache is not None:
+            cache.touch(website)
+            content = cache.get(website)
+        else:
+            response.raise_for_status()
+            content = response.text
+            if cache is not None:
+                cache.put(website, content, response.headers)
+        if content is None:
+            return None
+        with profiling.span("html_parse"):
+            return parse_article_content(content)
+    except httpx.HTTPError as e:
+        print(f"Cannot fetch {website} with http: {e}")
+        return None
+    except Exception as e:
+        # One broken page (decoding, parsing, cache) must not stop the whole crawl
+        print(f"Cannot read {website} with http: {e!r}")
+        return None
+
+
+def parse_cached_page(path: pathlib.Path | None) -> tuple[str, str | None] | Exception:
+    if path is None:
+        return FileNotFoundError("Page not in cache")
+    res = parse_article_content(read_page(path))
+    return ValueError(f"No article found in {path}") if res is None else res
+
+
+def parse_cached_articles(
+        cache: PageCache,
+        links: list[str],
+        num_workers: int = 8) -> dict[str, tuple[str, str | None] | Exception]:
+    """Parse cached pages in a process pool, without any network access."""
+    paths = [cache.object_path(link) for link in links]
+    # Spans of the worker processes are not collected: one span for the whole pool
+    with profiling.span("html_parse"), concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+        contents = executor.map(parse_cached_page, paths, chunksize=16)
+        return dict(zip(links, contents))
+
+
+def fetch_articles(
+        links: list[str],
+        num_workers: int = 8,
+        use_http: bool = True,
+        cache: PageCache | None = None) -> dict[str, tuple[str, str | None] | Exception]:
+    """Fetch articles with a pooled keep-alive http client, Playwright only for pages the http path cannot parse."""
+    res: dict[str, tuple[str, str | None] | Exception] = {}
+    fallback = list(links)
+    if use_http:
+        limits = httpx.Limits(max_connections=num_workers, max_keepalive_connections=num_workers)
+        with httpx.Client(limits=limits, timeout=30, follow_redirects=True, headers=HTTP_HEADERS) as client:
+            with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+                contents = executor.map(functools.partial(extract_article_content_http, client, cache=cache), links)
+                for link, content in zip(links, contents):
+                    if content is not None:
+                        res[link] = content
+        fallback = [link for link in links if link not in res]
+        print(f"Fetched {len(res)} articles with http, {len(fallback)} with playwright")
+    for link in fallback:
+        try:
+            res[link] = extract_article_content(link, cache)
+        except Exception as e:
+            res[link] = e
+    return res
 
     
 
@@ -116,40 +219,56 @@ def extract_article_links(website: str) -> dict[str, str]:
     return res
 
 def remove_tashkeel(text):
-    # Regular expression pattern for Arabic tashkeel
-    tashkeel_pattern = re.compile(r'[\u0617-\u061A\u064B-\u0652\u06D6-\u06ED\u08D4-\u08E1\u08D4-\u08ED\u08F4-\u08FF]')
-    
-
+    return segmentation.remove_tashkeel(text)
 
-    # Remove tashkeel
-    text_without_tashkeel = re.sub(tashkeel_pattern, '', text)
-    
-    return text_without_tashkeel
-
-def main(out_json: pathlib.Path):
+def main(
+        out_json: pathlib.Path,
+        num_workers: int = 8,
+        use_http: bool = True,
+        cache_dir: pathlib.Path | None = None,
+        from_cache: bool = False,
+        profile: pathlib.Path | None = None):
 
-    articles = extract_article_links(WEBSITE)
+    profiling.start_profiling(profile)
+    cache = None if cache_dir is None else PageCache(cache_dir)
+    if from_cache:
+        if cache is None:
+            raise ValueError("--from-cache needs --cache-dir")
+        articles = cache.load_articles()
+        contents = parse_cached_articles(cache, [content['link'] for content in articles.values()], num_workers)
+    else:
+        with profiling.span("page_fetch"):
+            articles = extract_article_links(WEBSITE)
+        if cache is not None:
+            cache.save_articles(articles)
+        contents = fetch_articles([content['link'] for content in articles.values()], num_workers, use_http, cache)
     for title, content in articles.items():
         print(title, content['link'], content["lang_break_content"])
         print("-"*20)
-        try: 
-            article, tashkeel = extract_article_content(content['link'])
-        except Exception as e:
-            print("Cannot extract article: continue", e)
+        article_content = contents[content['link']]
+        if isinstance(article_content, Exception):
+            print("Cannot extract article: continue", article_content)
             continue
-        sentences = [s for s in re.split('[.]', article) if len(s.strip()) > 0]
+        article, tashkeel = article_content
+        with profiling.span("segmentation"):
+            sentences = split_sentences(article)
+            pairs = None
+            if tashkeel is not None:
+                sentences_tashkeel = split_sentences(tashkeel)
+                pairs = align_sentences(sentences, sentences_tashkeel)
         articles[title]["article"] = sentences
-        if tashkeel is not None:
-            sentences_tashkeel = [s for s in re.split('[.]', tashkeel) if len(s.strip()) > 0]
-            sentences = [remove_tashkeel(sentence) for sentence in sentences_tashkeel]
-            articles[title]["tashkeel"] = sentences_tashkeel
-            articles[title]["article"] = sentences
-            print(f"num sentence text {len(sentences)}. Num sentence tashkeel {len(sentences_tashkeel)}")
+        if pairs is not None:
+            articles[title]["article"] = [sentence for sentence, _ in pairs]
+            articles[title]["tashkeel"] = [sentence_tashkeel for _, sentence_tashkeel in pairs]
+            print(
+                f"num sentence text {len(sentences)}. Num sentence tashkeel {len(sentences_tashkeel)}. "
+                f"Num aligned {len(pairs)}")
             
 
     out_json.parent.mkdir(parents=True, exist_ok=True)
-    with open(out_json, "w", encoding="utf-8") as f:
+    with profiling.span("output_write"), open(out_json, "w", encoding="utf-8") as f:
         json.dump(articles, f, ensure_ascii=False, indent=4)
+    profiling.finish_profiling(profile)
 
         
 
@@ -158,6 +277,11 @@ def main(out_json: pathlib.Path):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Scrape aljazeera learning to have a variety of text with tashkeel")
     parser.add_argument("--out-json", "-o", type=pathlib.Path)
+    parser.add_argument("--num-workers", type=int, default=8, help="Number of concurrent http requests")
+    parser.add_argument("--playwright-only", action="store_true", help="Render every article with Playwright")
+    parser.add_argument("--cache-dir", type=pathlib.Path, default=None, help="Keep the raw html pages in this directory")
+    parser.add_argument("--from-cache", action="store_true", help="Parse the pages of --cache-dir without the network")
+    profiling.add_profile_argument(parser)
     args = parser.parse_args()
-    main(args.out_json)
+    main(args.out_json, args.num_workers, not args.playwright_only, args.cache_dir, args.from_cache, args.profile)
     
@@ -2,3 +2,22 @@ from .prepare_models import prepare_qwen_models
 from .prepare_models import prepare_groq_model
 from .prepare_models import QwenLLM
 from .template_translation_arabic import create_workflow
+from .segmentation import align_sentences
+from .segmentation import chunk_sentence
+from .segmentation import chunk_sentence_pair
+from .segmentation import split_sentences
+from .scheduler import schedule
+from .scheduler import ThroughputMeter
+from .work_queue import WorkQueue
+from .template_fused_analysis import create_fused_workflow
+from .template_fused_analysis import WORKFLOWS
+from .llm_stats import LLMCallCounter
+from .vocabulary_store import ShardWriter
+from .vocabulary_store import load_records
+from .vocabulary_store import write_shard
+from .template_translation_arabic import parse_vocabulary
+from .template_translation_arabic import vocabulary_to_dict
+from .page_cache import PageCache
+from .prepare_models import CpuLLM
+from .prepare_models import prepare_cpu_model
+from .prepare_models import prepare_llm
@@ -0,0 +1,70 @@
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from .scheduler import estimate_tokens
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Count LLM calls and tokens of everything run with `config={"callbacks": [counter]}`.
+
+    Token usage reported by the provider (Groq) is used when available, otherwise tokens are estimated.
+    Calls, seconds and completion tokens are also kept per langgraph node in `per_node`.
+    """
+
+    def __init__(self, tokenizer: Optional[Any] = None) -> None:
+        self.tokenizer = tokenizer
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.per_node: dict[str, dict[str, float]] = {}
+        self._pending_prompt_tokens: dict[Any, int] = {}
+        self._pending_start: dict[Any, tuple[str, float]] = {}
+
+    def _on_start(self, run_id: Any, texts: list[str], metadata: Optional[dict]) -> None:
+        node = (metadata or {}).get("langgraph_node", "unknown")
+        with self.lock:
+            self.calls += 1
+            self._pending_prompt_tokens[run_id] = sum(estimate_tokens(text, self.tokenizer) for text in texts)
+            self._pending_start[run_id] = (node, time.time())
+
+    def on_llm_start(
+            self,
+            serialized: dict,
+            prompts: list[str],
+            *,
+            run_id: Any,
+            metadata: Optional[dict] = None,
+            **kwargs: Any) -> None:
+        self._on_start(run_id, prompts, metadata)
+
+    def on_chat_model_start(
+            self,
+            serialized: dict,
+            messages: list[list],
+            *,
+            run_id: Any,
+            metadata: Optional[dict] = None,
+            **kwargs: Any) -> None:
+        self._on_start(run_id, [str(message.content) for batch in messages for message in batch], metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: Any, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        completion = "".join(gen.text for generations in response.generations for gen in generations)
+        with self.lock:
+            estimated_prompt = self._pending_prompt_tokens.pop(run_id, 0)
+            completion_tokens = usage.get("completion_tokens", estimate_tokens(completion, self.tokenizer))
+            self.prompt_tokens += usage.get("prompt_tokens", estimated_prompt)
+            self.completion_tokens += completion_tokens
+            node, start = self._pending_start.pop(run_id, ("unknown", time.time()))
+            stats = self.per_node.setdefault(node, {"calls": 0, "seconds": 0.0, "completion_tokens": 0})
+            stats["calls"] += 1
+            stats["seconds"] += time.time() - start
+            stats["completion_tokens"] += completion_tokens
@@ -0,0 +1,112 @@
+"""Raw html pages on disk so the parsing of the scraper can be run again without the network.
+
+Pages are content addressed (`objects/<sha256 of the html>.html.gz`), an index file per url
+(`index/<sha256 of the url>.json`) keeps the object name and the ETag / Last-Modified headers used
+to revalidate the page with a conditional request.
+"""
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+from typing import Any, Mapping, Optional
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PageCache:
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+        (directory / "index").mkdir(exist_ok=True, parents=True)
+        (directory / "objects").mkdir(exist_ok=True, parents=True)
+
+    def _index_path(self, url: str) -> pathlib.Path:
+        return self.directory / "index" / f"{_sha256(url)}.json"
+
+    def metadata(self, url: str) -> Optional[dict[str, Any]]:
+        path = self._index_path(url)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def object_path(self, url: str) -> Optional[pathlib.Path]:
+        metadata = self.metadata(url)
+        if metadata is None:
+            return None
+        path = self.directory / "objects" / metadata["object"]
+        return path if path.exists() else None
+
+    def get(self, url: str) -> Optional[str]:
+        path = self.object_path(url)
+        return None if path is None else read_page(path)
+
+    def conditional_headers(self, url: str) -> dict[str, str]:
+        """Headers to revalidate the cached page, empty if the page is not cached."""
+        metadata = self.metadata(url)
+        if metadata is None or self.object_path(url) is None:
+            return {}
+        headers = {}
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+        return headers
+
+    def put(self, url: str, content: str, headers: Optional[Mapping[str, str]] = None) -> pathlib.Path:
+        headers = headers or {}
+        name = f"{_sha256(content)}.html.gz"
+        path = self.directory / "objects" / name
+        if not path.exists():
+            try:
+                _atomic_write(path, gzip.compress(content.encode("utf-8")))
+            except OSError:
+                # Another thread wrote the same content first
+                if not path.exists():
+                    raise
+        metadata = {
+            "url": url,
+            "object": name,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "fetched_at": time.time(),
+        }
+        _atomic_write(self._index_path(url), json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+        return path
+
+    def touch(self, url: str) -> None:
+        """Record that the cached page was revalidated (304 Not Modified)."""
+        metadata = self.metadata(url)
+        if metadata is not None:
+            metadata["fetched_at"] = time.time()
+            _atomic_write(self._index_path(url), json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+
+    def save_articles(self, articles: dict[str, dict]) -> None:
+        """Keep the list of articles (title, link, lang_break_content) for offline runs."""
+        _atomic_write(
+            self.directory / "articles.json", json.dumps(articles, ensure_ascii=False, indent=4).encode("utf-8"))
+
+    def load_articles(self) -> dict[str, dict]:
+        with open(self.directory / "articles.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def read_page(path: pathlib.Path) -> str:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def _atomic_write(path: pathlib.Path, data: bytes) -> None:
+    # Unique temporary name, several threads may write the same content addressed object
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp", delete=False) as f:
+        f.write(data)
+    try:
+        os.replace(f.name, path)
+    finally:
+        if os.path.exists(f.name):
+            os.remove(f.name)
@@ -1,11 +1,24 @@
-from typing import List, Optional
+import concurrent.futures
+import copy
+import queue
+import threading
+import time
+from typing import Any, Iterator, List, Optional
 
 from langchain.llms.base import LLM
+from langchain_core.callbacks import CallbackManagerForLLMRun
 from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import Generation
+from langchain_core.outputs import GenerationChunk
+from langchain_core.outputs import LLMResult
 from langchain_groq import ChatGroq
 from pydantic import BaseModel
+from pydantic import PrivateAttr
+import torch
 import transformers
 
+SYSTEM_PROMPT = "You are a helpful assistant, expert in arabic and english language."
+
 
 class QwenLLM(LLM, BaseModel):
     model: transformers.Qwen2ForCausalLM 
@@ -18,6 +31,18 @@ class QwenLLM(LLM, BaseModel):
     def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
         return execute_prompt(prompt, self.model, self.tokenizer)
 
+    def _stream(
+            self,
+            prompt: str,
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> Iterator[GenerationChunk]:
+        for text in stream_prompt(prompt, self.model, self.tokenizer):
+            chunk = GenerationChunk(text=text)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
 def prepare_qwen_models(model_name: str = "Qwen/Qwen2.5-72B-Instruct-AWQ") -> QwenLLM:
     
 
@@ -32,6 +57,149 @@ def prepare_qwen_models(model_name: str = "Qwen/Qwen2.5-72B-Instruct-AWQ") -> Qw
     return llm
 
 
+class CpuLLM(LLM, BaseModel):
+    """Small instruction model running on CPU.
+
+    The key/value cache of the system prompt, shared by every prompt, is computed once and reused.
+    With `max_batch_size > 1`, prompts sent concurrently (the nodes of the sentences of a
+    `graph.batch`) are collected for up to `batch_wait` seconds and generated in one padded batch.
+    """
+    model: transformers.PreTrainedModel
+    tokenizer: transformers.PreTrainedTokenizerBase
+    max_new_tokens: int = 2048
+    max_batch_size: int = 1
+    batch_wait: float = 0.05
+    prefix_ids: Optional[Any] = None
+    prefix_cache: Optional[Any] = None
+    _requests: queue.Queue = PrivateAttr(default_factory=queue.Queue)
+    _worker: Optional[threading.Thread] = PrivateAttr(default=None)
+    _worker_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "custom"
+
+    def build_prefix_cache(self) -> None:
+        prefix = self.tokenizer.apply_chat_template(
+            [{"role": "system", "content": SYSTEM_PROMPT}], tokenize=False)
+        self.prefix_ids = self.tokenizer(prefix, return_tensors="pt").input_ids
+        cache = transformers.DynamicCache()
+        with torch.inference_mode():
+            self.model(self.prefix_ids, past_key_values=cache, use_cache=True)
+        self.prefix_cache = cache
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        if self.max_batch_size <= 1:
+            return self.generate_one(prompt)
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._batch_loop, daemon=True)
+                self._worker.start()
+        future = concurrent.futures.Future()
+        self._requests.put((prompt, future))
+        return future.result()
+
+    def _generate(
+            self,
+            prompts: List[str],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> LLMResult:
+        if len(prompts) == 1:
+            return LLMResult(generations=[[Generation(text=self._call(prompts[0], stop))]])
+        return LLMResult(generations=[[Generation(text=text)] for text in self.generate_batch(prompts)])
+
+    def _stream(
+            self,
+            prompt: str,
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> Iterator[GenerationChunk]:
+        # Streamed prompts are generated alone, without the batch queue nor the prefix cache
+        for text in stream_prompt(
+                prompt, self.model, self.tokenizer, max_new_tokens=self.max_new_tokens, do_sample=False):
+            chunk = GenerationChunk(text=text)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    def _batch_loop(self) -> None:
+        """Generate the queued prompts, up to max_batch_size at a time."""
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            prompts = [prompt for prompt, _ in batch]
+            try:
+                texts = [self.generate_one(prompts[0])] if len(prompts) == 1 else self.generate_batch(prompts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), text in zip(batch, texts):
+                future.set_result(text)
+
+    def generate_one(self, prompt: str) -> str:
+        model_inputs = prepare_inputs(prompt, self.model, self.tokenizer)
+        kwargs = {}
+        if self.prefix_cache is not None:
+            n = self.prefix_ids.shape[1]
+            if torch.equal(model_inputs.input_ids[0, :n], self.prefix_ids[0]):
+                # generate only computes the tokens after the cached prefix
+                kwargs["past_key_values"] = copy.deepcopy(self.prefix_cache)
+        with torch.inference_mode():
+            generated_ids = self.model.generate(
+                **model_inputs, max_new_tokens=self.max_new_tokens, do_sample=False, **kwargs)
+        generated_ids = generated_ids[:, model_inputs.input_ids.shape[1]:]
+        return self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
+
+    def generate_batch(self, prompts: List[str]) -> List[str]:
+        texts = [
+            self.tokenizer.apply_chat_template(
+                [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+                tokenize=False,
+                add_generation_prompt=True)
+            for prompt in prompts
+        ]
+        self.tokenizer.padding_side = "left"
+        model_inputs = self.tokenizer(texts, return_tensors="pt", padding=True)
+        with torch.inference_mode():
+            generated_ids = self.model.generate(
+                **model_inputs, max_new_tokens=self.max_new_tokens, do_sample=False)
+        generated_ids = generated_ids[:, model_inputs.input_ids.shape[1]:]
+        return self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+
+
+def prepare_cpu_model(
+        model_name: str = "Qwen/Qwen2.5-1.5B-Instruct",
+        num_threads: Optional[int] = None,
+        quantize: bool = True,
+        max_new_tokens: int = 2048,
+        max_batch_size: int = 1) -> CpuLLM:
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    model = transformers.AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=torch.float32,
+    )
+    model.eval()
+    if quantize:
+        # int8 weights for the linear layers, activations are quantized on the fly
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    tokenizer = transformers.AutoTokenizer.from_pretrained(model_name)
+
+    llm = CpuLLM(model=model, tokenizer=tokenizer, max_new_tokens=max_new_tokens, max_batch_size=max_batch_size)
+    llm.build_prefix_cache()
+    return llm
+
+
 def prepare_groq_model(model_name: str = "mistral-saba-24b") -> ChatGroq:
     llm = ChatGroq(
         model=model_name,
@@ -46,12 +214,12 @@ def prepare_groq_model(model_name: str = "mistral-saba-24b") -> ChatGroq:
 
 
 
-def execute_prompt(
+def prepare_inputs(
         prompt: str,
         model: transformers.AutoModelForCausalLM,
         tokenizer: transformers.AutoTokenizer):
     messages = [
-        {"role": "system", "content": "You are a helpful assistant, expert in arabic and english language."},
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": prompt}
     ]
     text = tokenizer.apply_chat_template(
@@ -59,7 +227,14 @@ def execute_prompt(
     tokenize=False,
     add_generation_prompt=True
     )
-    model_inputs = tokenizer([text], return_tensors="pt").to(model.device)
+    return tokenizer([text], return_tensors="pt").to(model.device)
+
+
+def execute_prompt(
+        prompt: str,
+        model: transformers.AutoModelForCausalLM,
+        tokenizer: transformers.AutoTokenizer):
+    model_inputs = prepare_inputs(prompt, model, tokenizer)
 
     generated_ids = model.generate(
         **model_inputs,
@@ -72,3 +247,49 @@ def execute_prompt(
     response = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
     return response
 
+
+def stream_prompt(
+        prompt: str,
+        model: transformers.AutoModelForCausalLM,
+        tokenizer: transformers.AutoTokenizer,
+        max_new_tokens: int = 8192,
+        **generate_kwargs: Any) -> Iterator[str]:
+    """Same as execute_prompt but yield the text as soon as tokens are generated."""
+    model_inputs = prepare_inputs(prompt, model, tokenizer)
+    streamer = transformers.TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors = []
+
+    def generate():
+        try:
+            with torch.inference_mode():
+                model.generate(**model_inputs, max_new_tokens=max_new_tokens, streamer=streamer, **generate_kwargs)
+        except Exception as e:
+            errors.append(e)
+            # Unblock the loop below, it would wait on the streamer forever
+            streamer.end()
+
+    thread = threading.Thread(target=generate)
+    thread.start()
+    for text in streamer:
+        if len(text) > 0:
+            yield text
+    thread.join()
+    if len(errors) > 0:
+        raise errors[0]
+
+
+BACKENDS = ("qwen", "groq", "cpu")
+
+
+def prepare_llm(
+        backend: str = "qwen",
+        num_threads: Optional[int] = None,
+        max_batch_size: int = 1) -> QwenLLM | ChatGroq | CpuLLM:
+    if backend == "groq":
+        return prepare_groq_model()
+    elif backend == "cpu":
+        return prepare_cpu_model(num_threads=num_threads, max_batch_size=max_batch_size)
+    elif backend == "qwen":
+        return prepare_qwen_models()
+    else:
+        raise ValueError(f"Unknown backend {backend}. Choose among {BACKENDS}.")
@@ -0,0 +1,180 @@
+"""Timing and memory spans for the pipeline stages, enabled with `--profile`.
+
+    with profiling.span("llm_call"):
+        ...
+
+    start = profiling.now()
+    ...
+    profiling.record("prompt_build", start)
+
+Spans cost nothing when profiling is disabled. When enabled, tracemalloc records the memory
+allocated inside each span, a Chrome trace (chrome://tracing or https://ui.perfetto.dev) is
+written at the end and a per-stage breakdown is printed.
+tracemalloc is process wide: the memory of a span also counts the allocations of spans running
+at the same time in other threads (graph nodes, http fetches), and a span opened inside another
+one resets the peak of the outer span. Memory figures are exact only for sequential stages.
+Spans opened in process pools (offline html parsing) are not collected. Queue workers
+(`automatic_translation_all.py --queue --num-workers N`) each write `<profile>.<pid>.json`,
+merged into the main trace when they are done.
+"""
+import argparse
+import contextlib
+import json
+import os
+import pathlib
+import threading
+import time
+import tracemalloc
+from typing import Any, Iterator, Optional
+
+
+class Profiler:
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.events: list[dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.origin_time = time.time()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self.origin = time.perf_counter()
+        self.origin_time = time.time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def record(self, name: str, start: float, memory_start: Optional[int] = None) -> None:
+        """Add a span started at `start` (from `now()`) and ending now.
+
+        Without `memory_start` the span has no memory figures.
+        """
+        if not self.enabled:
+            return
+        end = time.perf_counter()
+        memory_delta, memory_peak = 0, 0
+        if memory_start is not None:
+            memory_end, peak = tracemalloc.get_traced_memory()
+            memory_delta = memory_end - memory_start
+            # Peak since the start of the span (reset in `_span`), above the memory at the start
+            memory_peak = max(peak - memory_start, 0)
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"memory_delta": memory_delta, "memory_peak": memory_peak},
+        }
+        with self.lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def _span(self, name: str) -> Iterator[None]:
+        tracemalloc.reset_peak()
+        memory_start, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, memory_start)
+
+    def span(self, name: str) -> contextlib.AbstractContextManager:
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._span(name)
+
+    def write_chrome_trace(self, path: pathlib.Path) -> None:
+        path.parent.mkdir(exist_ok=True, parents=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"traceEvents": self.events, "displayTimeUnit": "ms", "otherData": {"origin_time": self.origin_time}}, f)
+
+    def merge_trace(self, path: pathlib.Path) -> None:
+        """Add the events of a trace written by another process, aligned on this trace's clock."""
+        with open(path, "r", encoding="utf-8") as f:
+            trace = json.load(f)
+        shift = (trace["otherData"]["origin_time"] - self.origin_time) * 1e6
+        with self.lock:
+            for event in trace["traceEvents"]:
+                event["ts"] += shift
+                self.events.append(event)
+
+    def summary(self) -> str:
+        stages: dict[str, dict[str, float]] = {}
+        for event in self.events:
+            stats = stages.setdefault(event["name"], {"count": 0, "seconds": 0.0, "memory": 0, "peak": 0})
+            stats["count"] += 1
+            stats["seconds"] += event["dur"] / 1e6
+            stats["memory"] += event["args"]["memory_delta"]
+            stats["peak"] = max(stats["peak"], event["args"]["memory_peak"])
+        wall = max(time.perf_counter() - self.origin, 1e-9)
+        lines = [
+            f"Wall time {wall:.2f}s. Stages running concurrently (LLM calls, page fetches) can add up to more than 100%",
+            "Memory is process wide, approximate for stages running concurrently",
+            f"{'stage':<16}{'count':>8}{'total s':>10}{'mean ms':>10}{'% wall':>8}{'alloc MB':>10}{'~peak MB':>10}",
+        ]
+        for name, stats in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(
+                f"{name:<16}{stats['count']:>8}{stats['seconds']:>10.2f}"
+                f"{1e3 * stats['seconds'] / stats['count']:>10.1f}{100 * stats['seconds'] / wall:>8.1f}"
+                f"{stats['memory'] / 1e6:>10.2f}{stats['peak'] / 1e6:>10.2f}")
+        return "\n".join(lines)
+
+    def finish(self, path: Optional[pathlib.Path]) -> None:
+        """Write the trace and print the per-stage breakdown if profiling is enabled."""
+        if not self.enabled or path is None:
+            return
+        self.write_chrome_trace(path)
+        print(f"Profile written to {path}")
+        print(self.summary())
+
+
+PROFILER = Profiler()
+
+
+def span(name: str) -> contextlib.AbstractContextManager:
+    return PROFILER.span(name)
+
+
+def now() -> float:
+    return time.perf_counter()
+
+
+def record(name: str, start: float) -> None:
+    PROFILER.record(name, start)
+
+
+def add_profile_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile", type=pathlib.Path, default=None,
+        help="Write a Chrome trace of the pipeline stages to this file and print a per-stage breakdown")
+
+
+def start_profiling(path: Optional[pathlib.Path]) -> None:
+    if path is not None:
+        PROFILER.enable()
+
+
+def finish_profiling(path: Optional[pathlib.Path]) -> None:
+    PROFILER.finish(path)
+
+
+def worker_trace_path(path: pathlib.Path, pid: int) -> pathlib.Path:
+    return path.with_name(f"{path.name}.{pid}.json")
+
+
+def write_worker_trace(path: Optional[pathlib.Path]) -> None:
+    """Save the spans of a worker process next to the main trace, see `merge_worker_traces`."""
+    if PROFILER.enabled and path is not None:
+        PROFILER.write_chrome_trace(worker_trace_path(path, os.getpid()))
+
+
+def merge_worker_traces(path: Optional[pathlib.Path]) -> None:
+    """Add the traces written by the worker processes to the main trace and remove them."""
+    if not PROFILER.enabled or path is None:
+        return
+    for worker_path in sorted(path.parent.glob(f"{path.name}.*.json")):
+        PROFILER.merge_trace(worker_path)
+        worker_path.unlink()
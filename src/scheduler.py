@@ -0,0 +1,88 @@
+import dataclasses
+import math
+from typing import Any, Iterator, Optional
+
+POLICIES = ("insertion", "shortest", "longest", "bucketed")
+
+# Rough number of characters per token for Arabic text with BPE tokenizers
+CHARS_PER_TOKEN = 3.0
+
+
+def estimate_tokens(sentence: str, tokenizer: Optional[Any] = None) -> int:
+    if tokenizer is not None:
+        return len(tokenizer.encode(sentence))
+    return max(1, math.ceil(len(sentence) / CHARS_PER_TOKEN))
+
+
+def bucket_by_length(costs: dict[str, int], num_buckets: int) -> list[list[str]]:
+    """Group sentences in `num_buckets` buckets of similar cost, shortest bucket first.
+
+    Bucket edges are quantiles of the costs so every bucket holds about the same number of sentences.
+    Insertion order is kept inside a bucket.
+    """
+    if len(costs) == 0:
+        return []
+    num_buckets = max(1, min(num_buckets, len(costs)))
+    sorted_costs = sorted(costs.values())
+    edges = [sorted_costs[(len(sorted_costs) * k) // num_buckets] for k in range(1, num_buckets)]
+    buckets: list[list[str]] = [[] for _ in range(num_buckets)]
+    for sentence, cost in costs.items():
+        idx = 0
+        while idx < len(edges) and cost >= edges[idx]:
+            idx += 1
+        buckets[idx].append(sentence)
+    return [bucket for bucket in buckets if len(bucket) > 0]
+
+
+def schedule(
+        sentences: dict[str, dict],
+        policy: str = "insertion",
+        batch_size: int = 1,
+        num_buckets: int = 8,
+        tokenizer: Optional[Any] = None) -> Iterator[tuple[list[str], int]]:
+    """Yield batches of sentences in the order given by `policy`, with the estimated tokens of each batch.
+
+    - insertion: order of the input file.
+    - shortest: cheapest sentences first.
+    - longest: most expensive sentences first, so stragglers start early.
+    - bucketed: length buckets, shortest bucket first; a batch never mixes two buckets.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy}. Choose among {POLICIES}.")
+    costs = {sentence: estimate_tokens(sentence, tokenizer) for sentence in sentences}
+    if policy == "insertion":
+        groups = [list(costs)]
+    elif policy == "shortest":
+        groups = [sorted(costs, key=costs.__getitem__)]
+    elif policy == "longest":
+        groups = [sorted(costs, key=costs.__getitem__, reverse=True)]
+    else:
+        groups = bucket_by_length(costs, num_buckets)
+    for group in groups:
+        for start in range(0, len(group), batch_size):
+            batch = group[start:start + batch_size]
+            yield batch, sum(costs[sentence] for sentence in batch)
+
+
+@dataclasses.dataclass
+class ThroughputMeter:
+    policy: str
+    tokenizer: Optional[Any] = None
+    num_sentences: int = 0
+    num_tokens: int = 0
+    elapsed: float = 0.0
+
+    def update(self, batch: list[str], elapsed: float, num_tokens: Optional[int] = None) -> None:
+        """Count a batch. `num_tokens` is the cost given by `schedule`, estimated again if missing."""
+        self.num_sentences += len(batch)
+        if num_tokens is None:
+            num_tokens = sum(estimate_tokens(sentence, self.tokenizer) for sentence in batch)
+        self.num_tokens += num_tokens
+        self.elapsed += elapsed
+
+    def report(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"policy={self.policy}: {self.num_sentences} sentences in {self.elapsed:.1f}s, "
+            f"{self.num_sentences / elapsed:.3f} sentences/s, {self.num_tokens / elapsed:.1f} input tokens/s")
+
@@ -0,0 +1,158 @@
+import bisect
+import re
+from typing import Iterable
+
+# Regular expression pattern for Arabic tashkeel
+TASHKEEL_PATTERN = re.compile(r'[\u0617-\u061A\u064B-\u0652\u06D6-\u06ED\u08D4-\u08E1\u08D4-\u08ED\u08F4-\u08FF]')
+
+# Hard sentence boundaries: latin/arabic full stop, question marks, exclamation, arabic semicolon, ellipsis.
+# A dot between two digits (3.5) is not a boundary. Closing quotes/brackets stay with the sentence.
+SENTENCE_END_PATTERN = re.compile(r'(?:[!?\u061F\u061B\u06D4\u2026]|(?<!\d)\.|\.(?!\d))+["\'\u00BB\u201D\u2019)\]]*')
+
+# Soft boundaries used to chunk long sentences: arabic comma, latin comma, colon.
+CLAUSE_END_PATTERN = re.compile(r'[\u060C,:]["\'\u00BB\u201D\u2019)\]]*$')
+
+_RESYNC_KEY_LENGTH = 12
+
+_ALEF_PATTERN = re.compile(r'[\u0622\u0623\u0625\u0671]')
+_NON_LETTER_PATTERN = re.compile(r'[^\u0621-\u063A\u0641-\u064A\u0660-\u0669a-zA-Z0-9]')
+
+
+def remove_tashkeel(text: str) -> str:
+    return re.sub(TASHKEEL_PATTERN, '', text)
+
+
+def skeleton(text: str) -> str:
+    """Letters only, without diacritics, punctuation, spaces, tatweel and with alef/ya normalized.
+
+    Two renderings of the same sentence (plain and tashkeel) share the same skeleton.
+    """
+    text = remove_tashkeel(text)
+    text = _ALEF_PATTERN.sub('ا', text)
+    text = text.replace('ى', 'ي')
+    return _NON_LETTER_PATTERN.sub('', text)
+
+
+def split_sentences(text: str) -> list[str]:
+    sentences = []
+    start = 0
+    for match in SENTENCE_END_PATTERN.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    sentences.append(text[start:])
+
+    res: list[str] = []
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if len(sentence) == 0:
+            continue
+        if len(skeleton(sentence)) == 0 and len(res) > 0:
+            # Stray punctuation or quote: glue it to the previous sentence
+            res[-1] = f"{res[-1]} {sentence}"
+        else:
+            res.append(sentence)
+    return res
+
+
+def _resync(
+        plain_sk: list[str],
+        tashkeel_index: dict[str, list[int]],
+        i: int,
+        j: int) -> tuple[int, int] | None:
+    """Next (plain, tashkeel) positions after (i, j) where both sentences start the same way."""
+    for k in range(i, len(plain_sk)):
+        candidates = tashkeel_index.get(plain_sk[k][:_RESYNC_KEY_LENGTH], [])
+        lower = j + 1 if k == i else j
+        idx = bisect.bisect_left(candidates, lower)
+        if idx < len(candidates):
+            return k, candidates[idx]
+    return None
+
+
+def align_sentences(sentences: Iterable[str], sentences_tashkeel: Iterable[str]) -> list[tuple[str, str]]:
+    """Pair plain sentences with their tashkeel counterpart.
+
+    Both lists are walked once: consecutive sentences are merged on the side with the shorter
+    skeleton until both skeletons have the same length. When skeletons diverge, the group is dropped
+    and the walk restarts at the next pair of sentences sharing the same beginning, so one extra or
+    missing sentence does not discard the rest of the article.
+    """
+    plain = [s for s in sentences if len(skeleton(s)) > 0]
+    tashkeel = [s for s in sentences_tashkeel if len(skeleton(s)) > 0]
+    plain_sk = [skeleton(s) for s in plain]
+    tashkeel_sk = [skeleton(s) for s in tashkeel]
+    tashkeel_index: dict[str, list[int]] = {}
+    for idx, sk in enumerate(tashkeel_sk):
+        tashkeel_index.setdefault(sk[:_RESYNC_KEY_LENGTH], []).append(idx)
+
+    pairs = []
+    i, j = 0, 0
+    while i < len(plain) and j < len(tashkeel):
+        start_i, start_j = i, j
+        acc_plain, acc_tashkeel = plain_sk[i], tashkeel_sk[j]
+        i, j = i + 1, j + 1
+        while len(acc_plain) != len(acc_tashkeel):
+            n = min(len(acc_plain), len(acc_tashkeel))
+            if acc_plain[:n] != acc_tashkeel[:n]:
+                break
+            if len(acc_plain) < len(acc_tashkeel) and i < len(plain):
+                acc_plain += plain_sk[i]
+                i += 1
+            elif len(acc_tashkeel) < len(acc_plain) and j < len(tashkeel):
+                acc_tashkeel += tashkeel_sk[j]
+                j += 1
+            else:
+                break
+        if acc_plain == acc_tashkeel:
+            pairs.append((" ".join(plain[start_i:i]), " ".join(tashkeel[start_j:j])))
+        else:
+            restart = _resync(plain_sk, tashkeel_index, start_i, start_j)
+            if restart is None:
+                break
+            i, j = restart
+    return pairs
+
+
+def _length(words: list[str]) -> int:
+    return sum(len(w) for w in words) + max(len(words) - 1, 0)
+
+
+def _chunk_boundaries(words: list[str], max_chars: int) -> list[int]:
+    """Greedy cut indices so each chunk stays under max_chars, preferring to cut after a clause.
+
+    A clause cut is only used if the chunk before it has at least a third of max_chars, so a
+    short leading clause (`كان،`) is not sent alone. A single word longer than max_chars stays whole.
+    """
+    min_chars = max_chars // 3
+    boundaries = []
+    start = 0
+    for idx in range(len(words)):
+        while idx > start and _length(words[start:idx + 1]) > max_chars:
+            clauses = [
+                k for k in range(start + 1, idx + 1)
+                if CLAUSE_END_PATTERN.search(words[k - 1]) and _length(words[start:k]) >= min_chars
+            ]
+            cut = clauses[-1] if len(clauses) > 0 else idx
+            boundaries.append(cut)
+            start = cut
+    return boundaries
+
+
+def _cut(words: list[str], boundaries: list[int]) -> list[str]:
+    edges = [0] + boundaries + [len(words)]
+    return [" ".join(words[a:b]) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def chunk_sentence(sentence: str, max_chars: int) -> list[str]:
+    words = sentence.split()
+    return _cut(words, _chunk_boundaries(words, max_chars))
+
+
+def chunk_sentence_pair(sentence: str, sentence_tashkeel: str, max_chars: int) -> list[tuple[str, str]]:
+    """Chunk a plain/tashkeel pair at the same word positions, the budget is computed on the plain text."""
+    words = sentence.split()
+    words_tashkeel = sentence_tashkeel.split()
+    if len(words) != len(words_tashkeel):
+        return [(sentence, sentence_tashkeel)]
+    boundaries = _chunk_boundaries(words, max_chars)
+    return list(zip(_cut(words, boundaries), _cut(words_tashkeel, boundaries)))
@@ -0,0 +1,155 @@
+import functools
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain.llms.base import LLM
+from langgraph import graph
+import markdown
+import pydantic
+
+from . import profiling
+from .template_translation_arabic import ArabicState
+from .template_translation_arabic import WordAnalysis
+from .template_translation_arabic import _maybe_return_content
+from .template_translation_arabic import aggregate
+from .template_translation_arabic import create_workflow
+from .template_translation_arabic import extract_json_from_markdown
+from .template_translation_arabic import get_explanation
+from .template_translation_arabic import get_tashkeel
+from .template_translation_arabic import get_translation
+from .template_translation_arabic import get_word_by_word_analysis
+from .template_translation_arabic import parse_vocabulary
+
+
+class FusedAnalysis(pydantic.BaseModel):
+    tashkeel_sentence: str = pydantic.Field(min_length=1, description="The sentence with tashkeel")
+    translated_sentence: str = pydantic.Field(min_length=1, description="The English translation")
+    vocabulary: dict[str, WordAnalysis] = pydantic.Field(min_length=1, description="Word by word analysis")
+    explanation: str = pydantic.Field(min_length=1, description="Grammatical explanation in markdown")
+
+
+# Node computing each field when the fused answer is not valid
+FALLBACK_NODES = {
+    "tashkeel_sentence": "get_tashkeel",
+    "translated_sentence": "get_translation",
+    "vocabulary": "get_word_by_word_analysis",
+    "explanation": "get_explanation",
+}
+
+
+def validate_fused_analysis(data: Any) -> dict[str, Any]:
+    """Keep the fields of the LLM answer that are valid, formatted like the four-node graph outputs.
+
+    The vocabulary is validated word by word: invalid words are kept as plain dicts and the
+    vocabulary node is only called again if there is no usable vocabulary at all.
+    """
+    if not isinstance(data, dict):
+        return {}
+    res = {}
+    vocabulary = parse_vocabulary(data.get("vocabulary"))
+    if vocabulary is not None:
+        res["vocabulary"] = vocabulary
+    failed = set()
+    try:
+        FusedAnalysis.model_validate(data)
+    except pydantic.ValidationError as e:
+        failed = {err["loc"][0] for err in e.errors() if len(err["loc"]) > 0}
+    for field in FusedAnalysis.model_fields:
+        if field in failed or field not in data or field == "vocabulary":
+            continue
+        if field == "explanation":
+            res[field] = markdown.markdown(data[field])
+        else:
+            res[field] = data[field]
+    return res
+
+
+def get_fused_analysis(state: ArabicState, llm: BaseChatModel | LLM) -> dict[str, Any]:
+    start = profiling.now()
+    example_json = """
+    {
+        "tashkeel_sentence": "لَقَدْ كَانَ جَابِرُ بْنُ حَيَّانَ عَالِمًا",
+        "translated_sentence": "Jabir ibn Hayyan was indeed a scholar.",
+        "vocabulary": {
+            "لقد": {
+                "meanings": ["indeed", "certainly"],
+                "pronounciation": "laqad",
+                "root": {"root_word": "قد", "root_meaning": "to be able, to be certain"},
+                "examples": [{"قد فعل": "he has done"}],
+                "singular/plural": {}
+            },
+            "عالما": {
+                "meanings": ["a scholar", "a scientist"],
+                "pronounciation": "ʿāliman",
+                "root": {"root_word": "علم", "root_meaning": "knowledge, to know"},
+                "examples": [{"عِلم": "science, knowledge"}],
+                "singular/plural": {"singular": "عالِم", "plural": "عُلَماء"}
+            }
+        },
+        "explanation": "## Grammatical Breakdown\\n..."
+    }
+    """
+
+    query = f"""Analyze the Arabic sentence and answer with one JSON object with these keys:
+    - 'tashkeel_sentence': the sentence with full 'tashkeel' (diacritical marks), preserving meaning and syntax.
+    - 'translated_sentence': an accurate and natural English translation.
+    - 'vocabulary': for each word, its meanings (most relevant first), its pronounciation, its root with its meaning, examples of words sharing the root, and singular/plural forms if it is a noun.
+    - 'explanation': a markdown explanation with a grammatical breakdown, idiomatic expressions and historical or religious references.
+
+    # Example
+    Input: لقد كان جابر بن حيان عالما
+    Output:
+    ```json
+    {example_json}
+    ```
+
+    Input: {state.arabic_sentence}
+    Output:
+    """
+    profiling.record("prompt_build", start)
+    with profiling.span("llm_call"):
+        msg = llm.invoke(query)
+    msg = _maybe_return_content(msg)
+    with profiling.span("json_parse"):
+        return validate_fused_analysis(extract_json_from_markdown(msg))
+
+
+def route_missing_fields(state: ArabicState) -> list[str]:
+    """Call the per-field node for every field the fused answer did not provide."""
+    if state.tashkeel_sentence is None:
+        return ["get_tashkeel"]
+    missing = [
+        node for field, node in FALLBACK_NODES.items()
+        if field != "tashkeel_sentence" and getattr(state, field) is None
+    ]
+    return missing if len(missing) > 0 else ["aggregate"]
+
+
+def create_fused_workflow(llm: LLM | BaseChatModel) -> graph.StateGraph:
+    workflow = graph.StateGraph(ArabicState)
+
+    # One call for every field, then fallback nodes for the invalid ones
+    workflow.add_node("get_fused_analysis", functools.partial(get_fused_analysis, llm=llm))
+    workflow.add_node("get_tashkeel", functools.partial(get_tashkeel, llm=llm))
+    workflow.add_node("get_translation", functools.partial(get_translation, llm=llm))
+    workflow.add_node("get_word_by_word_analysis", functools.partial(get_word_by_word_analysis, llm=llm))
+    workflow.add_node("get_explanation", functools.partial(get_explanation, llm=llm))
+    workflow.add_node("aggregate", aggregate)
+
+    workflow.add_edge(graph.START, "get_fused_analysis")
+    fallback = ["get_translation", "get_word_by_word_analysis", "get_explanation", "aggregate"]
+    workflow.add_conditional_edges("get_fused_analysis", route_missing_fields, ["get_tashkeel"] + fallback)
+    workflow.add_conditional_edges("get_tashkeel", route_missing_fields, fallback)
+
+    workflow.add_edge("get_translation", "aggregate")
+    workflow.add_edge("get_word_by_word_analysis", "aggregate")
+    workflow.add_edge("get_explanation", "aggregate")
+
+    workflow.add_edge("aggregate", graph.END)
+    return workflow
+
+
+WORKFLOWS = {
+    "graph": create_workflow,
+    "fused": create_fused_workflow,
+}
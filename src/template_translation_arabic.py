@@ -6,10 +6,17 @@ from typing import Any
 from langchain_core.language_models import BaseChatModel
 from langchain.llms.base import LLM
 from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph import graph
+from langgraph.config import get_stream_writer
 import markdown
 import pydantic
 
+from . import profiling
+
+# Set to True in the "configurable" config by callers reading graph.stream(..., stream_mode="custom")
+STREAM_TRANSLATION_KEY = "stream_translation"
+
 
 def _maybe_return_content(msg: str | BaseMessage) -> str:
     if isinstance(msg, str):
@@ -19,15 +26,28 @@ def _maybe_return_content(msg: str | BaseMessage) -> str:
     else:
         raise ValueError("Undefined output LLM type.")
 
+class WordAnalysis(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(populate_by_name=True)
+
+    meanings: list[str] = pydantic.Field(description="List of meanings with the most relevant first")
+    pronounciation: str = pydantic.Field(default="N/A", description="The pronunciation of the word")
+    root: dict = pydantic.Field(default_factory=dict, description="Root word and its meaning if applicable")
+    examples: list = pydantic.Field(default_factory=list, description="List of example words with their meanings")
+    singular_plural: dict = pydantic.Field(
+        default_factory=dict, alias="singular/plural", description="Singular and plural forms if the word is a noun")
+
+
 class ArabicState(pydantic.BaseModel):
     arabic_sentence: str
     tashkeel_sentence: str | None = pydantic.Field(default=None, exclude=True)
     translated_sentence: str | None = pydantic.Field(default=None, exclude=True)
-    vocabulary: str | None = pydantic.Field(default=None, exclude=True)
+    # Raw dict for words whose analysis is not valid, raw LLM answer if no JSON is found
+    vocabulary: dict[str, WordAnalysis | dict] | str | None = pydantic.Field(default=None, exclude=True)
     explanation: str | None = pydantic.Field(default=None, exclude=True)
     combined_output: dict[str, Any] | None = pydantic.Field(default=None, exclude=True)
 
 def get_tashkeel(state: ArabicState, llm: BaseChatModel | LLM) -> dict[str, str]:
+    start = profiling.now()
     query = f"""Get the 'tashkeel' (diacritical marks) of this arabic phrase, ensuring the meaning, tone, and syntax are preserved accurately.
     
     # Steps
@@ -51,11 +71,15 @@ def get_tashkeel(state: ArabicState, llm: BaseChatModel | LLM) -> dict[str, str]
     Input: {state.arabic_sentence}
     Output:
     """
-    msg = llm.invoke(query)
+    profiling.record("prompt_build", start)
+    with profiling.span("llm_call"):
+        msg = llm.invoke(query)
     msg = _maybe_return_content(msg)
     return {"tashkeel_sentence": msg}
 
-def get_translation(state: ArabicState, llm: BaseChatModel | LLM) -> dict[str, str]:
+def get_translation(
+        state: ArabicState, llm: BaseChatModel | LLM, config: RunnableConfig | None = None) -> dict[str, str]:
+    start = profiling.now()
     query = f"""Translate the given Arabic text into English accurately.
 
     # Steps
@@ -77,16 +101,43 @@ def get_translation(state: ArabicState, llm: BaseChatModel | LLM) -> dict[str, s
     Input: {state.tashkeel_sentence}
     Output:
     """
-    msg = llm.invoke(query)
-    msg = _maybe_return_content(msg)
+    profiling.record("prompt_build", start)
+    stream = config is not None and config.get("configurable", {}).get(STREAM_TRANSLATION_KEY, False)
+    with profiling.span("llm_call"):
+        if stream:
+            # Stream the translation so graph.stream(..., stream_mode="custom") can show it token by token
+            writer = get_stream_writer()
+            chunks = []
+            for chunk in llm.stream(query):
+                text = _maybe_return_content(chunk)
+                chunks.append(text)
+                writer({"translated_sentence": text})
+            msg = "".join(chunks)
+        else:
+            msg = _maybe_return_content(llm.invoke(query))
     return {"translated_sentence": msg}
 
-class WordAnalysis(pydantic.BaseModel):
-    meanings: list[str] = pydantic.Field(description="List of meanings with the most relevant first")
-    pronounciation: str = pydantic.Field(description="The pronunciation of the word")
-    root: dict = pydantic.Field(description="Root word and its meaning if applicable")
-    examples: list = pydantic.Field(description="List of example words with their meanings")
-    singular_plural: dict = pydantic.Field(description="Singular and plural forms if the word is a noun")
+def parse_vocabulary(data: Any) -> dict[str, WordAnalysis | dict] | None:
+    """Validate the word by word analysis, words with an invalid analysis are kept as plain dicts."""
+    if not isinstance(data, dict):
+        return None
+    vocab = {}
+    for word, details in data.items():
+        try:
+            vocab[word] = WordAnalysis.model_validate(details)
+        except pydantic.ValidationError as e:
+            print(f"Invalid analysis for {word}, kept as is: {e}")
+            vocab[word] = details
+    return vocab if len(vocab) > 0 else None
+
+
+def vocabulary_to_dict(vocab: dict[str, WordAnalysis | dict] | str | None) -> dict[str, dict] | str | None:
+    if vocab is None or isinstance(vocab, str):
+        return vocab
+    return {
+        word: analysis.model_dump(by_alias=True) if isinstance(analysis, WordAnalysis) else analysis
+        for word, analysis in vocab.items()
+    }
 
 
 def extract_json_from_markdown(markdown_text: str) -> None | Any:
@@ -105,9 +156,11 @@ def extract_json_from_markdown(markdown_text: str) -> None | Any:
         print("No JSON found")
         return None
 
-def get_word_by_word_analysis(state: ArabicState, llm: BaseChatModel | LLM) -> dict[str, str]:
-
+def get_word_by_word_analysis(
+        state: ArabicState,
+        llm: BaseChatModel | LLM) -> dict[str, dict[str, WordAnalysis | dict] | str | None]:
 
+    start = profiling.now()
     example_json =  """
     {
         "لقد": {
@@ -249,21 +302,23 @@ def get_word_by_word_analysis(state: ArabicState, llm: BaseChatModel | LLM) -> d
     Output:
     """
 
-    msg = llm.invoke(query)
+    profiling.record("prompt_build", start)
+    with profiling.span("llm_call"):
+        msg = llm.invoke(query)
     msg = _maybe_return_content(msg)
-    vocab = extract_json_from_markdown(msg)
+    with profiling.span("json_parse"):
+        vocab = parse_vocabulary(extract_json_from_markdown(msg))
     if vocab is None:
+        # Keep the raw answer as before, the deck builder skips it
         return {"vocabulary": msg}
-    else:
-        return {
-            "vocabulary": json.dumps(vocab, ensure_ascii=False, indent=4)}
+    return {"vocabulary": vocab}
     
 
 
 
 def get_explanation(state: ArabicState, llm: BaseChatModel | LLM) -> dict[str, str]:
     
-    
+    start = profiling.now()
     query = f"""Analyze the following Arabic sentence:
 
     {state.tashkeel_sentence}
@@ -286,16 +341,18 @@ def get_explanation(state: ArabicState, llm: BaseChatModel | LLM) -> dict[str, s
     Format your response clearly, using headers for each section and bold for key terms.
     """
 
-    msg = llm.invoke(query)
+    profiling.record("prompt_build", start)
+    with profiling.span("llm_call"):
+        msg = llm.invoke(query)
     msg = _maybe_return_content(msg)
     return {"explanation": markdown.markdown(msg)}
 
-def aggregate(state: ArabicState) -> dict[str, dict[str, str | None]]:
-    combined_output: dict[str, str | None] = {}
+def aggregate(state: ArabicState) -> dict[str, dict[str, Any]]:
+    combined_output: dict[str, Any] = {}
     combined_output["arabic_sentence"] = state.arabic_sentence
     combined_output["tashkeel_sentence"] = state.tashkeel_sentence
     combined_output["translated_sentence"] = state.translated_sentence
-    combined_output["vocabulary"] = state.vocabulary
+    combined_output["vocabulary"] = vocabulary_to_dict(state.vocabulary)
     combined_output["explanation"] = state.explanation
     return {"combined_output": combined_output}
    
@@ -0,0 +1,161 @@
+"""Compact columnar shards for translated sentences.
+
+A shard is a gzip compressed JSON file holding two column oriented tables:
+- `sentences`: one row per sentence, nested keys are flattened (`llm_output.translated_sentence`),
+  repetitive columns (title, link, ...) are dictionary encoded.
+- `vocabulary`: one row per analysed word, `row` points to the sentence. Analyses without exactly
+  the expected fields (legacy or invalid LLM answers) are kept unchanged in the `raw` column.
+
+Loading returns the same records as the legacy JSON output, with the vocabulary as a dict.
+"""
+import gzip
+import json
+import os
+import pathlib
+import time
+from typing import Any
+
+SHARD_SUFFIX = ".json.gz"
+VOCABULARY_KEY = "llm_output.vocabulary"
+VOCABULARY_COLUMNS = ("word", "meanings", "pronounciation", "root", "examples", "singular/plural")
+
+
+def _flatten(record: dict[str, Any], prefix: str = "") -> dict[str, Any]:
+    res = {}
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and name != VOCABULARY_KEY:
+            res.update(_flatten(value, f"{name}."))
+        else:
+            res[name] = value
+    return res
+
+
+def _unflatten(row: dict[str, Any]) -> dict[str, Any]:
+    res: dict[str, Any] = {}
+    for name, value in row.items():
+        node = res
+        *parents, key = name.split(".")
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[key] = value
+    return res
+
+
+def _encode_column(values: list[Any]) -> Any:
+    """Dictionary encode a column of strings when it has many repeated values."""
+    if all(isinstance(v, str) for v in values):
+        uniques = list(dict.fromkeys(values))
+        if len(uniques) * 2 <= len(values):
+            index = {v: i for i, v in enumerate(uniques)}
+            return {"dictionary": uniques, "codes": [index[v] for v in values]}
+    return values
+
+
+def _decode_column(column: Any) -> list[Any]:
+    if isinstance(column, dict):
+        dictionary = column["dictionary"]
+        return [dictionary[code] for code in column["codes"]]
+    return column
+
+
+def records_to_columns(records: dict[str, dict]) -> dict[str, Any]:
+    keys = list(records)
+    rows = [_flatten(record) for record in records.values()]
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    vocabulary: dict[str, list] = {"row": [], "raw": []}
+    vocabulary.update({name: [] for name in VOCABULARY_COLUMNS})
+    for idx, row in enumerate(rows):
+        vocab = row.get(VOCABULARY_KEY)
+        if not isinstance(vocab, dict):
+            continue
+        # Structured vocabulary goes to its own table, raw strings stay in the sentence table
+        row[VOCABULARY_KEY] = None
+        for word, details in vocab.items():
+            structured = isinstance(details, dict) and set(details) == set(VOCABULARY_COLUMNS[1:])
+            vocabulary["row"].append(idx)
+            vocabulary["word"].append(word)
+            vocabulary["raw"].append(None if structured else details)
+            for name in VOCABULARY_COLUMNS[1:]:
+                vocabulary[name].append(details[name] if structured else None)
+    return {
+        "keys": keys,
+        "sentences": {name: _encode_column([row.get(name) for row in rows]) for name in names},
+        "vocabulary": vocabulary,
+    }
+
+
+def columns_to_records(columns: dict[str, Any]) -> dict[str, dict]:
+    sentences = {name: _decode_column(column) for name, column in columns["sentences"].items()}
+    rows: list[dict[str, Any]] = [
+        {name: values[idx] for name, values in sentences.items()}
+        for idx in range(len(columns["keys"]))
+    ]
+    vocabulary = columns["vocabulary"]
+    raw = vocabulary.get("raw", [None] * len(vocabulary["row"]))
+    for i, idx in enumerate(vocabulary["row"]):
+        vocab = rows[idx].get(VOCABULARY_KEY)
+        if vocab is None:
+            vocab = rows[idx][VOCABULARY_KEY] = {}
+        if raw[i] is not None:
+            vocab[vocabulary["word"][i]] = raw[i]
+        else:
+            vocab[vocabulary["word"][i]] = {name: vocabulary[name][i] for name in VOCABULARY_COLUMNS[1:]}
+    return {key: _unflatten(row) for key, row in zip(columns["keys"], rows)}
+
+
+def write_shard(directory: pathlib.Path, records: dict[str, dict]) -> pathlib.Path:
+    """Write records in a new shard. Names sort chronologically so later shards win on load."""
+    directory.mkdir(exist_ok=True, parents=True)
+    path = directory / f"shard-{time.time_ns()}-{os.getpid()}{SHARD_SUFFIX}"
+    tmp = path.with_name(f"{path.name}.tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(records_to_columns(records), f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
+
+
+def read_shard(path: pathlib.Path) -> dict[str, dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return columns_to_records(json.load(f))
+
+
+def load_shards(directory: pathlib.Path) -> dict[str, dict]:
+    res = {}
+    if directory.exists():
+        for path in sorted(directory.glob(f"*{SHARD_SUFFIX}")):
+            res.update(read_shard(path))
+    return res
+
+
+def load_records(path: pathlib.Path) -> dict[str, dict]:
+    """Load translated sentences from a shard directory or a legacy JSON file."""
+    if path.is_dir():
+        return load_shards(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ShardWriter:
+    """Buffer records and write a shard every `shard_size` records."""
+
+    def __init__(self, directory: pathlib.Path, shard_size: int = 256) -> None:
+        self.directory = directory
+        self.shard_size = shard_size
+        self.buffer: dict[str, dict] = {}
+
+    def add(self, key: str, record: dict) -> None:
+        self.buffer[key] = record
+        if len(self.buffer) >= self.shard_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.buffer) > 0:
+            write_shard(self.directory, self.buffer)
+            self.buffer = {}
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.flush()
@@ -0,0 +1,166 @@
+import json
+import os
+import pathlib
+import sqlite3
+import time
+from typing import Any
+
+from .vocabulary_store import load_shards
+from .vocabulary_store import write_shard
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class WorkQueue:
+    """Sentences to translate stored in SQLite, shared by several worker processes on one host.
+
+    A worker leases a few sentences for `lease_timeout` seconds and renews the lease while it
+    translates them. If it crashes, the lease expires and another worker takes the sentences back. Results stay in the database until they are merged
+    into the usual JSON output.
+    """
+
+    def __init__(self, path: pathlib.Path, lease_timeout: float = 600, max_attempts: int = 3) -> None:
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        path.parent.mkdir(exist_ok=True, parents=True)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS sentences (
+                sentence TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sentences_status ON sentences (status, lease_until)")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def enqueue(self, items: dict[str, dict]) -> int:
+        """Add sentences that are not in the queue yet, in the given order. Return the number added."""
+        before = self.conn.total_changes
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO sentences (sentence, payload, status) VALUES (?, ?, ?)",
+            [(sentence, json.dumps(val, ensure_ascii=False), PENDING) for sentence, val in items.items()])
+        self.conn.execute("COMMIT")
+        return self.conn.total_changes - before
+
+    def lease(self, worker: str, n: int = 1) -> dict[str, dict]:
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE sentences SET status = ?, error = ? WHERE status = ? AND lease_until < ? AND attempts + 1 >= ?",
+                (FAILED, "lease expired", LEASED, now, self.max_attempts))
+            rows = self.conn.execute(
+                """SELECT sentence, payload FROM sentences
+                WHERE (status = ? OR (status = ? AND lease_until < ?)) AND attempts < ?
+                ORDER BY rowid LIMIT ?""",
+                (PENDING, LEASED, now, self.max_attempts, n)).fetchall()
+            # An expired lease counts as a failed attempt: the worker probably crashed on it
+            self.conn.executemany(
+                """UPDATE sentences SET
+                    attempts = attempts + CASE WHEN status = ? THEN 1 ELSE 0 END,
+                    status = ?,
+                    worker = ?,
+                    lease_until = ?
+                WHERE sentence = ?""",
+                [(LEASED, LEASED, worker, now + self.lease_timeout, sentence) for sentence, _ in rows])
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return {sentence: json.loads(payload) for sentence, payload in rows}
+
+    def renew(self, worker: str, sentences: list[str]) -> int:
+        """Push forward the lease of sentences the worker is still translating. Return the number renewed."""
+        before = self.conn.total_changes
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany(
+            "UPDATE sentences SET lease_until = ? WHERE sentence = ? AND status = ? AND worker = ?",
+            [(time.time() + self.lease_timeout, sentence, LEASED, worker) for sentence in sentences])
+        self.conn.execute("COMMIT")
+        return self.conn.total_changes - before
+
+    def complete(self, worker: str, results: dict[str, Any]) -> None:
+        """Store results. A sentence whose lease was taken over by another worker is still accepted."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany(
+            "UPDATE sentences SET status = ?, worker = ?, result = ?, lease_until = NULL WHERE sentence = ? AND status != ?",
+            [(DONE, worker, json.dumps(result, ensure_ascii=False), sentence, DONE) for sentence, result in results.items()])
+        self.conn.execute("COMMIT")
+
+    def release(self, sentences: list[str], error: str) -> None:
+        """Give leased sentences back after a failure; after `max_attempts` failures they are marked failed."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany(
+            """UPDATE sentences SET
+                attempts = attempts + 1,
+                status = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END,
+                lease_until = NULL,
+                error = ?
+            WHERE sentence = ? AND status = ?""",
+            [(self.max_attempts, FAILED, PENDING, error, sentence, LEASED) for sentence in sentences])
+        self.conn.execute("COMMIT")
+
+    def counts(self) -> dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM sentences GROUP BY status").fetchall()
+        res = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        res.update(dict(rows))
+        return res
+
+    def remaining(self) -> int:
+        counts = self.counts()
+        return counts[PENDING] + counts[LEASED]
+
+    def done_records(self) -> dict[str, dict]:
+        """Finished sentences in the format of the JSON output."""
+        res = {}
+        rows = self.conn.execute(
+            "SELECT sentence, payload, result FROM sentences WHERE status = ?", (DONE,)).fetchall()
+        for sentence, payload, result in rows:
+            val = json.loads(payload)
+            val["llm_output"] = json.loads(result)
+            res[sentence] = val
+        return res
+
+    def merge_into(self, output: pathlib.Path, output_format: str = "json") -> int:
+        """Add finished sentences to the output, in the same format as a single process run.
+
+        The database stays locked while the output is written so concurrent merges do not clobber each other.
+        Return the number of sentences that were not in the output yet.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = self.done_records()
+            if output_format == "shards":
+                existing = load_shards(output)
+                new = {sentence: val for sentence, val in done.items() if sentence not in existing}
+                if len(new) > 0:
+                    write_shard(output, new)
+                added = len(new)
+            else:
+                res = {}
+                if output.exists():
+                    with open(output, "r", encoding="utf-8") as f:
+                        res = json.load(f)
+                added = sum(1 for sentence in done if sentence not in res)
+                res.update(done)
+                output.parent.mkdir(exist_ok=True, parents=True)
+                tmp = output.with_name(f"{output.name}.{os.getpid()}.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(res, f, ensure_ascii=False, indent=4)
+                os.replace(tmp, output)
+        finally:
+            self.conn.execute("COMMIT")
+        return added